@@ -1,140 +1,576 @@
 """Simplified LLM-powered booking agent using Ollama."""
 
-import json
+import asyncio
+import hashlib
 import logging
-from typing import Dict, Optional, Any
-from datetime import datetime, timedelta
-from langchain_community.chat_models import ChatOllama
+import re
+import time
+from weakref import WeakKeyDictionary
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple, Any
+from datetime import date
+from functools import lru_cache, partial
+import httpx
+import orjson
+from ollama import AsyncClient
 from booking_client import BookingAPIClient
+from tools import DateTimeParser
 
 logger = logging.getLogger(__name__)
 
+# Keyword intent classifier used when the LLM output can't be parsed.
+# Group names are the intents understood by process_message.
+_INTENT_RE = re.compile(
+    r'(?P<cancel_booking>\bcancel\b)'
+    r'|(?P<update_booking>\b(?:change|modify|update|reschedule)\b)'
+    r'|(?P<check_booking>\b(?:check|find|look up)\b.*\b(?:booking|reservation)\b|\bmy (?:booking|reservation)\b)'
+    r'|(?P<check_availability>\bavailab(?:le|ility)\b|\bfree tables?\b)'
+    r'|(?P<make_booking>\bbook\b|\breserv(?:e|ation)\b|\btable for\b)'
+    r'|(?P<greeting>^\s*(?:hi|hello|hey|good (?:morning|afternoon|evening))\b)',
+    re.IGNORECASE
+)
+
+# Intents that feed the new-booking flow
+_BOOKING_INTENTS = frozenset({"make_booking", "provide_info"})
+
+# Intents that create, change or cancel a booking; a keyword match alone
+# is never enough to act on one
+_STATE_CHANGING_INTENTS = frozenset({"make_booking", "update_booking", "cancel_booking"})
+
+# Context fields the LLM needs to see; anything else stays out of the prompt
+_PROMPT_FIELDS = ('name', 'date', 'time', 'party_size', 'booking_reference',
+                  'special_requests', 'last_booking_reference')
+
+# Fields collected for a new booking, with how we ask for each one
+_FIELD_DESCRIPTIONS = {
+    'name': 'your name',
+    'date': 'the date you\'d like to visit',
+    'time': 'your preferred time',
+    'party_size': 'the number of people'
+}
+_BOOKING_FIELDS = tuple(_FIELD_DESCRIPTIONS)
+
+# Words the LLM sometimes returns as a customer name
+_BLOCKED_NAMES = frozenset({
+    'check', 'cancel', 'update', 'create', 'booking', 'reservation',
+    'availability', 'guest', 'user', 'null', 'none',
+    'yes', 'no', 'please', 'thanks', 'ok', 'okay', 'sure',
+    'today', 'tomorrow', 'tonight', 'weekend', 'monday', 'tuesday',
+    'wednesday', 'thursday', 'friday', 'saturday', 'sunday'
+})
+
+# One to four words of letters, apostrophes, hyphens and periods
+# (e.g. "J. R. Smith", "Dr. Smith")
+_NAME_RE = re.compile(r"[^\W\d_][\w'.-]*(?:\s+[^\W\d_][\w'.-]*){0,3}")
+
+# Messages kept per session
+_MAX_HISTORY = 20
+
+# Availability results kept for reuse across sessions
+_MAX_AVAILABILITY_ENTRIES = 256
+
+# Largest party we accept from a bare number
+_MAX_PARTY_SIZE = 20
+
+# Dates already in YYYY-MM-DD form
+_ISO_DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+# Valid 24-hour HH:MM times
+_HHMM_RE = re.compile(r'(?:[01]\d|2[0-3]):[0-5]\d')
+
+# Booking references: 6-7 upper-case letters and digits, with at least one
+# of each (e.g. ABC1234)
+_REF_PATTERN = r'(?=[A-Z0-9]*\d)(?=[A-Z0-9]*[A-Z])[A-Z0-9]{6,7}'
+_REF_RE = re.compile(rf'\b{_REF_PATTERN}\b')
+_CANCEL_REF_RE = re.compile(
+    rf'cancel(?: my)?(?: booking| reservation)?(?: ref(?:erence)?)?:?\s*(?:\b(?P<ref>{_REF_PATTERN}))?[\s.!]*',
+    re.IGNORECASE
+)
+
+# Times and party sizes spelled out in a message, for when the LLM can't
+# be used: "7pm", "7:30" or "at 7", and "for 4" or "4 people"
+_MESSAGE_TIME_RE = re.compile(
+    r'\b(?P<time>\d{1,2}(?::[0-5]\d)?\s*[ap]\.?m\b|\d{1,2}:[0-5]\d)'
+    r'|\bat\s+(?P<hour>\d{1,2})\b(?!\s*(?::|[ap]\.?m\b))',
+    re.IGNORECASE
+)
+_MESSAGE_PARTY_RE = re.compile(
+    r'\bfor\s+(?P<for>\d{1,2})\b(?!\s*(?::|[ap]\.?m\b))'
+    r'|\b(?P<people>\d{1,2})\s+(?:people|persons|guests)\b',
+    re.IGNORECASE
+)
+
+# Any other number, which may be a new party size ("make it six")
+_NUMBER_RE = re.compile(
+    r'\d|\b(?:one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve)\b',
+    re.IGNORECASE
+)
+
+# Messages that are nothing but a greeting, thanks or goodbye; longer
+# ones skip the check
+_MAX_GREETING_LEN = 30
+_GREETING_RE = re.compile(
+    r'(?:hi|hello|hey|good (?:morning|afternoon|evening))(?: there)?[\s!.]*',
+    re.IGNORECASE
+)
+_CLOSING_RE = re.compile(
+    r'(?:(?P<thanks>(?:thanks|thank you)(?: (?:so |very )?much| a lot)?|cheers)'
+    r'|(?P<goodbye>(?:good ?)?bye(?: bye)?|see you(?: soon| later)?))[\s!.]*',
+    re.IGNORECASE
+)
+
+
+# Ollama clients by event loop, then host. httpx connections can't be
+# used across event loops, and the sync wrappers run each call on a new
+# loop; a loop's clients are dropped along with it. Extraction replies run
+# to completion, so on a long-lived loop (the FastAPI app, aprocess_batch)
+# later turns reuse their connections. ollama's AsyncClient
+# can't be closed, so each is given an httpx transport we own, which holds
+# its connection pool and is closed instead.
+_ollama_clients: "WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Tuple[AsyncClient, httpx.AsyncHTTPTransport]]]" = WeakKeyDictionary()
+
+
+def _ollama_client(host: str) -> AsyncClient:
+    """The running loop's client for host, shared by all agents on it."""
+    clients = _ollama_clients.setdefault(asyncio.get_running_loop(), {})
+    entry = clients.get(host)
+    if entry is None:
+        transport = httpx.AsyncHTTPTransport()
+        entry = clients[host] = (AsyncClient(host=host, timeout=60, transport=transport), transport)
+    return entry[0]
+
+
+async def close_ollama_clients():
+    """Close the running loop's Ollama connection pools."""
+    for _, transport in _ollama_clients.pop(asyncio.get_running_loop(), {}).values():
+        await transport.aclose()
+
+
+def _is_plausible_name(value: Any) -> bool:
+    """Check an extracted name looks like a person's name."""
+    name = str(value).strip()
+    if not _NAME_RE.fullmatch(name):
+        return False
+    return not any(word in _BLOCKED_NAMES for word in name.lower().split())
+
+
+@lru_cache(maxsize=256)
+def _format_time(time_str: str) -> str:
+    """Format an 'H:MM' or API 'HH:MM[:SS]' time as e.g. '7:30 pm'.
+
+    Split by hand rather than through a strptime/strftime datetime
+    round trip; anything else is returned unchanged. Slot times come
+    from a small fixed set, so results are cached.
+    """
+    hour_str, _, rest = time_str.partition(':')
+    minute_str = rest[:2]
+    if not (len(hour_str) in (1, 2) and len(minute_str) == 2
+            and hour_str.isdecimal() and minute_str.isdecimal()):
+        return time_str
+    hour, minute = int(hour_str), int(minute_str)
+    if not (hour < 24 and minute < 60):
+        return time_str
+    return f"{hour % 12 or 12}:{minute:02d} {'am' if hour < 12 else 'pm'}"
+
+
+def _keyword_intent(message: str) -> str:
+    """Guess the intent from keywords in a single regex pass."""
+    match = _INTENT_RE.search(message)
+    return match.lastgroup if match else "unclear"
+
+
+def _fallback_intent(message: str) -> str:
+    """The keyword intent, for when the LLM fails, with state-changing
+    intents turned into "unclear"."""
+    intent = _keyword_intent(message)
+    return "unclear" if intent in _STATE_CHANGING_INTENTS else intent
+
+
+# Instructions for extracting intent and booking details. Kept free of
+# per-turn values so Ollama can reuse the cached prefix across requests.
+_UNDERSTAND_SYSTEM = """Extract the restaurant booking details in the user's message. Respond ONLY with this JSON object, using null for anything not mentioned:
+{"intent": "...", "name": "...", "date": "...", "time": "...", "party_size": ..., "booking_reference": "...", "special_requests": "..."}
+
+intent: check_availability, make_booking, check_booking, update_booking, cancel_booking, greeting, or provide_info (the message only gives details, e.g. just a name or "4 people")
+date: YYYY-MM-DD for a calendar date, otherwise the user's words (e.g. "tomorrow", "next friday")
+time: the user's words (e.g. "7pm", "7:30")
+party_size: number of people
+booking_reference: 6-7 letters and digits, e.g. ABC1234"""
+
+# The extraction JSON is ~60 tokens; a cap in case the stop sequence
+# never comes
+_UNDERSTAND_MAX_TOKENS = 160
+
+# Per-turn values sent after the static instructions. The date header only
+# changes daily, so it is rendered once per day by _date_header_for.
+_UNDERSTAND_USER = """{date_header}
+
+Current booking context:
+{context}
+
+User message: "{message}\""""
+
+# Multi-line replies; only the booking details vary
+_CONFIRMED_TEMPLATE = """🎉 Perfect! Your reservation is confirmed!
+
+**Booking Details:**
+📋 **Booking Reference:** {ref}
+👤 **Name:** {name}
+📅 **Date:** {date}
+🕐 **Time:** {time}
+👥 **Party Size:** {party_size} people
+
+Please save your booking reference ({ref}) - you'll need it to check or modify your reservation.
+
+See you soon at TheHungryUnicorn! 🦄"""
+
+_FOUND_BOOKING_TEMPLATE = """Found your booking!
+
+📋 **Booking Reference:** {ref}
+👤 **Name:** {first_name} {surname}
+📅 **Date:** {date}
+🕐 **Time:** {time}
+👥 **Party Size:** {party_size} people
+
+Would you like to modify or cancel this booking?"""
+
+# Fixed replies
+_GREETING_REPLY = "Hello! 👋 Welcome to TheHungryUnicorn! I can help you make a reservation, check availability, or manage existing bookings. What would you like to do today?"
+_THANKS_REPLY = "You're welcome! Is there anything else I can help you with?"
+_GOODBYE_REPLY = "Goodbye! We look forward to seeing you at TheHungryUnicorn! 🦄"
+_BOOKING_START_REPLY = "I'd be happy to help you make a reservation! To get started, could you tell me:\n• Your name\n• When you'd like to visit (date)\n• What time you prefer\n• How many people will be dining?"
+_HELP_REPLY = "I'm here to help with restaurant bookings! You can:\n• Check availability for a date\n• Make a new reservation\n• Check an existing booking (with reference)\n• Modify or cancel a booking\n\nWhat would you like to do?"
+_REF_HINT = "It should be a 6-7 character code like ABC1234."
+
+
+@lru_cache(maxsize=1)
+def _date_header_for(ordinal: int) -> str:
+    """The prompt's date header for the given day."""
+    today = date.fromordinal(ordinal)
+    return f"Today is {today:%A, %B %d, %Y} ({today.isoformat()})"
+
+
+def _resolve_when(extracted: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn the date and time phrases the LLM passes through into
+    YYYY-MM-DD and HH:MM; a date or time that can't be resolved is dropped."""
+    when = extracted.get('date')
+    if when:
+        # Dates already in YYYY-MM-DD form are kept as given
+        when = str(when).strip()
+        if not _ISO_DATE_RE.fullmatch(when):
+            when = DateTimeParser.parse_date(when)
+        extracted['date'] = when if _ISO_DATE_RE.fullmatch(when) else None
+    
+    at = extracted.get('time')
+    if at:
+        at = DateTimeParser.parse_time(str(at))
+        extracted['time'] = at if _HHMM_RE.fullmatch(at) else None
+    return extracted
+
+
 class BookingAgent:
     def __init__(self, api_client: BookingAPIClient, model: str = "llama3.2:3b", 
-                 temperature: float = 0.1, base_url: str = "http://localhost:11434"):
+                 temperature: float = 0.0, base_url: str = "http://localhost:11434",
+                 force_llm: bool = False, max_sessions: int = 10_000,
+                 session_ttl: float = 3600, understand_cache_size: int = 4096,
+                 keep_alive: str = "30m", llm_timeout: float = 8.0,
+                 availability_ttl: float = 30):
         self.api_client = api_client
-        self.llm = ChatOllama(
-            model=model, 
-            temperature=temperature, 
-            base_url=base_url,
-            timeout=60
-        )
-        self.sessions = {}
+        self.force_llm = force_llm  # Disable the rule-based fast path
+        self.model = model
+        self.temperature = temperature
+        self.base_url = base_url
+        # How long Ollama keeps the model loaded between requests; while it
+        # stays loaded the cached system-prompt prefix is reused
+        self.keep_alive = keep_alive
+        # Seconds an extraction may take before we fall back to keywords
+        self.llm_timeout = llm_timeout
+        # Sessions idle for session_ttl seconds expire, and the least
+        # recently used are evicted beyond max_sessions
+        self.sessions = OrderedDict()
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        # LRU of LLM extractions keyed by a hash of the prompt
+        self._understand_cache = OrderedDict()
+        self.understand_cache_size = understand_cache_size
+        self._pending_understand = {}
+        # Recent availability results by (date, party_size), shared across
+        # sessions; dropped after availability_ttl seconds or when a booking
+        # is made or cancelled
+        self._availability_cache = OrderedDict()
+        self.availability_ttl = availability_ttl
 
     def clear_memory(self, session_id: str):
         """Clear session memory."""
         if session_id in self.sessions:
             del self.sessions[session_id]
 
-    def _get_date_strings(self) -> Dict[str, str]:
-        """Get helpful date strings for the LLM."""
-        today = datetime.now()
-        tomorrow = today + timedelta(days=1)
-        
-        # Calculate this weekend
-        days_to_saturday = (5 - today.weekday()) % 7
-        if days_to_saturday == 0:
-            days_to_saturday = 7
-        saturday = today + timedelta(days=days_to_saturday)
-        
-        days_to_sunday = (6 - today.weekday()) % 7
-        if days_to_sunday == 0:
-            days_to_sunday = 7
-        sunday = today + timedelta(days=days_to_sunday)
-        
-        # Format dates nicely
-        return {
-            'today': today.strftime('%Y-%m-%d'),
-            'tomorrow': tomorrow.strftime('%Y-%m-%d'),
-            'saturday': saturday.strftime('%Y-%m-%d'),
-            'sunday': sunday.strftime('%Y-%m-%d'),
-            'today_formatted': today.strftime('%A, %B %d, %Y'),
-            'tomorrow_formatted': tomorrow.strftime('%A, %B %d, %Y'),
-            'saturday_formatted': saturday.strftime('%A, %B %d, %Y'),
-            'sunday_formatted': sunday.strftime('%A, %B %d, %Y')
-        }
-
-    def _understand_message(self, message: str, context: Dict) -> Dict[str, Any]:
-        """Use LLM to understand the user's message and extract information."""
-        dates = self._get_date_strings()
+    def _get_session(self, session_id: str) -> Dict[str, Any]:
+        """Get or create a session, evicting idle and least recently used ones."""
+        now = time.monotonic()
+        
+        # Sessions are kept in last-use order, so expired ones sit at the front
+        while self.sessions:
+            oldest = next(iter(self.sessions.values()))
+            if now - oldest['last_seen'] <= self.session_ttl:
+                break
+            self.sessions.popitem(last=False)
         
-        prompt = f"""You are helping understand a restaurant booking request. Extract information from the user's message.
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = {
+                'context': {},
+                'history': deque(maxlen=_MAX_HISTORY),
+                # Serialises turns, so concurrent messages in one session
+                # can't interleave (e.g. both creating the same booking)
+                'lock': asyncio.Lock()
+            }
+            if len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        else:
+            self.sessions.move_to_end(session_id)
+        
+        session['last_seen'] = now
+        return session
 
-Today is {dates['today_formatted']} ({dates['today']})
-Tomorrow is {dates['tomorrow_formatted']} ({dates['tomorrow']})
-This Saturday is {dates['saturday_formatted']} ({dates['saturday']})
-This Sunday is {dates['sunday_formatted']} ({dates['sunday']})
+    def _fast_understand(self, message: str, context: Dict) -> Optional[Dict[str, Any]]:
+        """Resolve trivial messages without an LLM call.
 
-Current booking context:
-{json.dumps(context, indent=2)}
+        Returns None when the message needs the LLM.
+        """
+        text = message.strip()
+        
+        # A bare number mid-booking is the party size, unless we already
+        # have one (then it may be a time, so let the LLM decide)
+        if text.isdigit():
+            if (not context.get('party_size')
+                    and any(context.get(field) for field in _BOOKING_FIELDS)):
+                party_size = int(text)
+                if 0 < party_size <= _MAX_PARTY_SIZE:
+                    return {"intent": "provide_info", "party_size": party_size}
+            return None
+        
+        if len(text) <= _MAX_GREETING_LEN:
+            if _GREETING_RE.fullmatch(text):
+                return {"intent": "greeting"}
+            closing = _CLOSING_RE.fullmatch(text)
+            if closing:
+                return {"intent": closing.lastgroup}
+        
+        # "cancel ABC1234", or a bare "cancel my booking", and nothing else;
+        # without a reference the one already in context is used
+        cancel = _CANCEL_REF_RE.fullmatch(text)
+        if cancel:
+            if cancel.group('ref'):
+                return {"intent": "cancel_booking", "booking_reference": cancel.group('ref').upper()}
+            return {"intent": "cancel_booking"}
+        
+        # A bare reference, or a booking lookup that names one
+        ref = _REF_RE.search(text)
+        if ref and (ref.group(0) == text or _keyword_intent(text) == "check_booking"):
+            return {"intent": "check_booking", "booking_reference": ref.group(0)}
+        
+        return None
+
+    def _fallback_understanding(self, message: str, context: Dict) -> Dict[str, Any]:
+        """Understand a message without the LLM, when it has failed.
+
+        Uses the fast path's answer if there is one; otherwise the keyword
+        intent plus any date, time, party size and booking reference the
+        message spells out, so "table for 4 tomorrow at 7" keeps its details.
+        """
+        understanding = self._fast_understand(message, context)
+        if understanding is not None:
+            return understanding
+        
+        understanding = {"intent": _fallback_intent(message)}
+        
+        iso_date = _ISO_DATE_RE.search(message)
+        visit_date = iso_date.group(0) if iso_date else DateTimeParser.parse_date(message)
+        if _ISO_DATE_RE.fullmatch(visit_date):
+            understanding['date'] = visit_date
+        
+        at = _MESSAGE_TIME_RE.search(message)
+        if at:
+            at = DateTimeParser.parse_time(at.group('time') or at.group('hour'))
+            if _HHMM_RE.fullmatch(at):
+                understanding['time'] = at
+        
+        party = _MESSAGE_PARTY_RE.search(message)
+        if party:
+            party_size = int(party.group('for') or party.group('people'))
+            if 0 < party_size <= _MAX_PARTY_SIZE:
+                understanding['party_size'] = party_size
+        
+        ref = _REF_RE.search(message)
+        if ref:
+            understanding['booking_reference'] = ref.group(0)
+        return understanding
 
-User message: "{message}"
+    def _cached_availability(self, key) -> Optional[Dict[str, Any]]:
+        """Return a fresh cached availability result for key, if any."""
+        entry = self._availability_cache.get(key)
+        if entry is None:
+            return None
+        stored_at, result = entry
+        if time.monotonic() - stored_at > self.availability_ttl:
+            del self._availability_cache[key]
+            return None
+        return result
 
-Extract the following information if present:
-1. intent: What does the user want? (check_availability, make_booking, check_booking, update_booking, cancel_booking, greeting, provide_info)
-2. name: Full name if provided
-3. date: Date in YYYY-MM-DD format
-4. time: Time in HH:MM format (assume PM for 5-11, use 24-hour format)
-5. party_size: Number of people
-6. booking_reference: Booking ID if mentioned (format: 6-7 alphanumeric characters like ABC1234)
-7. special_requests: Any special requests
+    def _cache_availability(self, key, result: Dict[str, Any]):
+        """Remember a successful availability result."""
+        if not result.get('success'):
+            return
+        self._availability_cache[key] = (time.monotonic(), result)
+        self._availability_cache.move_to_end(key)
+        if len(self._availability_cache) > _MAX_AVAILABILITY_ENTRIES:
+            self._availability_cache.popitem(last=False)
 
-Important:
-- For times like "7pm" convert to "19:00"
-- For times like "7:30pm" convert to "19:30"
-- For dates like "tomorrow" use {dates['tomorrow']}
-- For dates like "this weekend" or "saturday" use {dates['saturday']}
-- For dates like "next Friday" calculate the correct date
-- If the user provides just a name (like "John Smith"), set intent as "provide_info"
-- If they say a number of people (like "4" or "4 people"), extract party_size
+    def _speculate_lookup(self, message: str, context: Dict):
+        """Start a read-only API lookup before the LLM has answered.
+
+        A booking reference in the message starts get_booking; an
+        availability question with a known date starts check_availability.
+        The API round-trip then overlaps the LLM call. A party size stated
+        in the message is used over the one in context, and a message with
+        some other number, which may change it, isn't guessed at. Returns
+        (query, task) or None; see _await_lookup.
+        """
+        ref = _REF_RE.search(message)
+        if ref:
+            query = ('get_booking', ref.group(0))
+            call = partial(self.api_client.get_booking, ref.group(0))
+        elif _keyword_intent(message) == "check_availability":
+            iso_date = _ISO_DATE_RE.search(message)
+            parsed = iso_date.group(0) if iso_date else DateTimeParser.parse_date(message)
+            visit_date = parsed if _ISO_DATE_RE.fullmatch(parsed) else context.get('date')
+            if not visit_date:
+                return None
+            # Guess the party size this turn will end up with
+            party = _MESSAGE_PARTY_RE.search(message)
+            if party:
+                party_size = int(party.group('for') or party.group('people'))
+                if not 0 < party_size <= _MAX_PARTY_SIZE:
+                    return None
+            elif _NUMBER_RE.search(_MESSAGE_TIME_RE.sub('', _ISO_DATE_RE.sub('', message))):
+                return None
+            else:
+                party_size = context.get('party_size', 2)
+            if self._cached_availability((visit_date, party_size)) is not None:
+                return None
+            query = ('check_availability', visit_date, party_size)
+            call = partial(self.api_client.check_availability, date=visit_date, party_size=party_size)
+        else:
+            return None
+        
+        return query, asyncio.create_task(asyncio.to_thread(call))
 
-Respond ONLY with a JSON object, nothing else:
-{{"intent": "...", "name": "...", "date": "...", "time": "...", "party_size": ..., "booking_reference": "...", "special_requests": "..."}}
+    async def _await_lookup(self, speculative, query, call, *args, **kwargs) -> Dict[str, Any]:
+        """Use the speculative lookup if it matches query, else make the call."""
+        if speculative and speculative[0] == query:
+            return await speculative[1]
+        return await asyncio.to_thread(call, *args, **kwargs)
 
-Use null for any field not found in the message."""
+    async def _understand_message(self, message: str, context: Dict) -> Dict[str, Any]:
+        """Use LLM to understand the user's message and extract information."""
+        prompt_context = {k: context[k] for k in _PROMPT_FIELDS if k in context}
+        
+        prompt = _UNDERSTAND_USER.format(
+            date_header=_date_header_for(date.today().toordinal()),
+            context=orjson.dumps(prompt_context).decode(),
+            message=message
+        )
+        
+        # The prompt covers everything the answer depends on, so an identical
+        # prompt can reuse an earlier extraction
+        cache_key = hashlib.blake2b(prompt.encode(), digest_size=16).digest()
+        cached = self._understand_cache.get(cache_key)
+        if cached is not None:
+            self._understand_cache.move_to_end(cache_key)
+            return dict(cached)
 
+        # Identical prompts already in flight (e.g. several users sending
+        # "hi" at once) share a single LLM call
+        pending = self._pending_understand.get(cache_key)
+        if pending is None:
+            pending = asyncio.ensure_future(
+                asyncio.wait_for(self._extract_with_llm(prompt), self.llm_timeout)
+            )
+            self._pending_understand[cache_key] = pending
+            pending.add_done_callback(lambda _: self._pending_understand.pop(cache_key, None))
+        
         try:
-            response = self.llm.invoke(prompt)
-            content = response.content if hasattr(response, 'content') else str(response)
-            
-            # Clean and parse JSON
-            content = content.strip()
-            if '```json' in content:
-                content = content.split('```json')[1].split('```')[0]
-            elif '```' in content:
-                content = content.split('```')[1].split('```')[0]
-            
-            extracted = json.loads(content)
-            logger.info(f"Extracted: {extracted}")
-            return extracted
-            
+            extracted = await asyncio.shield(pending)
+        except asyncio.TimeoutError:
+            logger.warning("LLM took over %ss, falling back to keywords", self.llm_timeout)
+            return self._fallback_understanding(message, context)
         except Exception as e:
-            logger.error(f"Error understanding message: {e}")
-            return {"intent": "unclear"}
+            logger.error("Error understanding message: %s", e)
+            return self._fallback_understanding(message, context)
+        
+        self._understand_cache[cache_key] = extracted
+        if len(self._understand_cache) > self.understand_cache_size:
+            self._understand_cache.popitem(last=False)
+        return dict(extracted)
+
+    async def _extract_with_llm(self, prompt: str) -> Dict[str, Any]:
+        """Send the extraction prompt to Ollama and parse its JSON reply.
+
+        In JSON mode small models often pad the object with whitespace
+        until num_predict runs out, so generation stops at the object's
+        closing brace instead. The reply then completes normally and its
+        connection goes back to the pool for the next turn.
+        """
+        response = await _ollama_client(self.base_url).chat(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": _UNDERSTAND_SYSTEM},
+                {"role": "user", "content": prompt}
+            ],
+            format="json",
+            keep_alive=self.keep_alive,
+            options={
+                "temperature": self.temperature,
+                "num_predict": _UNDERSTAND_MAX_TOKENS,
+                "stop": ["}"]
+            }
+        )
+        
+        # format="json" constrains the model to emit a bare JSON object;
+        # Ollama leaves the stop sequence out of the reply. The object is
+        # flat, so its first "}" is the closing one.
+        content = response['message']['content'].rstrip()
+        if not content.endswith('}'):
+            content += '}'
+        extracted = orjson.loads(content)
+        
+        logger.debug("Extracted: %s", extracted)
+        return _resolve_when(extracted)
 
     def _generate_response(self, intent: str, context: Dict, api_result: Optional[Dict] = None) -> str:
         """Generate a natural response based on intent and context."""
-        dates = self._get_date_strings()
-        
         # Build the prompt based on the situation
         if intent == "greeting":
-            return "Hello! 👋 Welcome to TheHungryUnicorn! I can help you make a reservation, check availability, or manage existing bookings. What would you like to do today?"
+            return _GREETING_REPLY
+        
+        elif intent == "thanks":
+            return _THANKS_REPLY
+        
+        elif intent == "goodbye":
+            return _GOODBYE_REPLY
         
         elif intent == "check_availability" and api_result and api_result.get('success'):
             slots = api_result.get('data', {}).get('available_slots', [])
             if slots:
-                date = context.get('date', 'the selected date')
+                visit_date = context.get('date', 'the selected date')
                 times = []
                 for slot in slots[:10]:  # Show max 10 slots
                     time_str = slot.get('time', slot) if isinstance(slot, dict) else str(slot)
                     # Convert to 12-hour format for display
-                    try:
-                        time_obj = datetime.strptime(time_str.split(':')[0] + ':' + time_str.split(':')[1], '%H:%M')
-                        times.append(time_obj.strftime('%-I:%M %p').lower())
-                    except:
-                        times.append(time_str)
+                    times.append(_format_time(str(time_str)))
                 
-                return f"Great! I found available times for {date}:\n\n" + \
+                return f"Great! I found available times for {visit_date}:\n\n" + \
                        "• " + "\n• ".join(times) + \
                        "\n\nWhich time would work best for you?"
             else:
@@ -147,49 +583,29 @@ Use null for any field not found in the message."""
             # Format the date nicely
             date_str = context.get('date', '')
             try:
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-                formatted_date = date_obj.strftime('%A, %B %d, %Y')
+                formatted_date = date.fromisoformat(date_str).strftime('%A, %B %d, %Y')
             except:
                 formatted_date = date_str
             
             # Format the time nicely
-            time_str = context.get('time', '')
-            try:
-                time_obj = datetime.strptime(time_str, '%H:%M:%S')
-                formatted_time = time_obj.strftime('%-I:%M %p').lower()
-            except:
-                formatted_time = time_str
+            formatted_time = _format_time(str(context.get('time', '')))
             
-            return f"""🎉 Perfect! Your reservation is confirmed!
-
-**Booking Details:**
-📋 **Booking Reference:** {booking_ref}
-👤 **Name:** {context.get('name', 'Guest')}
-📅 **Date:** {formatted_date}
-🕐 **Time:** {formatted_time}
-👥 **Party Size:** {context.get('party_size', 2)} people
-
-Please save your booking reference ({booking_ref}) - you'll need it to check or modify your reservation.
-
-See you soon at TheHungryUnicorn! 🦄"""
+            return _CONFIRMED_TEMPLATE.format(
+                ref=booking_ref,
+                name=context.get('name', 'Guest'),
+                date=formatted_date,
+                time=formatted_time,
+                party_size=context.get('party_size', 2)
+            )
         
-        elif intent in ["make_booking", "provide_info"]:
+        elif intent in _BOOKING_INTENTS:
             # Check what's missing
-            required = {
-                'name': 'your name',
-                'date': 'the date you\'d like to visit',
-                'time': 'your preferred time',
-                'party_size': 'the number of people'
-            }
-            
-            missing = []
-            for field, description in required.items():
-                if not context.get(field):
-                    missing.append(description)
+            missing = [description for field, description in _FIELD_DESCRIPTIONS.items()
+                       if not context.get(field)]
             
             if missing:
                 if len(missing) == 4:  # Nothing provided yet
-                    return "I'd be happy to help you make a reservation! To get started, could you tell me:\n• Your name\n• When you'd like to visit (date)\n• What time you prefer\n• How many people will be dining?"
+                    return _BOOKING_START_REPLY
                 elif len(missing) == 1:
                     return f"Great! I just need {missing[0]} to complete your booking."
                 else:
@@ -199,59 +615,74 @@ See you soon at TheHungryUnicorn! 🦄"""
         
         elif intent == "check_booking":
             if not context.get('booking_reference'):
-                return "I'd be happy to check your booking! Could you please provide your booking reference? It should be a 6-7 character code like ABC1234."
+                return "I'd be happy to check your booking! Could you please provide your booking reference? " + _REF_HINT
             elif api_result and api_result.get('success'):
                 data = api_result.get('data', {})
-                return f"""Found your booking!
-
-📋 **Booking Reference:** {data.get('booking_reference')}
-👤 **Name:** {data.get('customer', {}).get('first_name', '')} {data.get('customer', {}).get('surname', '')}
-📅 **Date:** {data.get('visit_date')}
-🕐 **Time:** {data.get('visit_time')}
-👥 **Party Size:** {data.get('party_size')} people
-
-Would you like to modify or cancel this booking?"""
+                customer = data.get('customer', {})
+                return _FOUND_BOOKING_TEMPLATE.format(
+                    ref=data.get('booking_reference'),
+                    first_name=customer.get('first_name', ''),
+                    surname=customer.get('surname', ''),
+                    date=data.get('visit_date'),
+                    time=data.get('visit_time'),
+                    party_size=data.get('party_size')
+                )
         
         elif intent == "cancel_booking":
             if not context.get('booking_reference'):
-                return "To cancel a booking, I'll need your booking reference. It should be a 6-7 character code like ABC1234."
+                return "To cancel a booking, I'll need your booking reference. " + _REF_HINT
             elif api_result and api_result.get('success'):
                 return f"✅ Your booking (reference: {context.get('booking_reference')}) has been successfully cancelled. Is there anything else I can help you with?"
         
         elif intent == "update_booking":
             if not context.get('booking_reference'):
-                return "To update a booking, I'll need your booking reference first. It should be a 6-7 character code like ABC1234."
+                return "To update a booking, I'll need your booking reference first. " + _REF_HINT
             else:
                 return "What would you like to change about your booking? You can update the date, time, or number of people."
         
         # Default response
-        return "I'm here to help with restaurant bookings! You can:\n• Check availability for a date\n• Make a new reservation\n• Check an existing booking (with reference)\n• Modify or cancel a booking\n\nWhat would you like to do?"
+        return _HELP_REPLY
 
     def process_message(self, message: str, session_id: str) -> str:
         """Process a user message and return a response."""
-        # Get or create session
-        if session_id not in self.sessions:
-            self.sessions[session_id] = {
-                'context': {},
-                'history': []
-            }
-        
-        session = self.sessions[session_id]
+        return asyncio.run(self.aprocess_message(message, session_id))
+
+    async def aprocess_message(self, message: str, session_id: str) -> str:
+        """Process a user message without blocking the event loop.
+
+        LLM calls are awaited and the (blocking) booking API calls run in a
+        worker thread, so concurrent sessions overlap instead of queueing.
+        Turns within one session run one at a time.
+        """
+        session = self._get_session(session_id)
+        async with session['lock']:
+            return await self._process_turn(session, message)
+
+    async def _process_turn(self, session: Dict[str, Any], message: str) -> str:
+        """Handle one message for a session whose lock is held."""
         context = session['context']
         
         # Add to history
         session['history'].append({'role': 'user', 'content': message})
         
         # Understand the message
-        understanding = self._understand_message(message, context)
+        speculative = None
+        understanding = None if self.force_llm else self._fast_understand(message, context)
+        if understanding is None:
+            # Only worth guessing ahead while waiting on the LLM
+            speculative = self._speculate_lookup(message, context)
+            understanding = await self._understand_message(message, context)
         intent = understanding.get('intent', 'unclear')
         
         # Update context with new information (skip null values)
         for key, value in understanding.items():
-            if value is not None and key != 'intent':
-                context[key] = value
+            if value is None or key == 'intent':
+                continue
+            if key == 'name' and not _is_plausible_name(value):
+                continue
+            context[key] = value
         
-        logger.info(f"Intent: {intent}, Context: {context}")
+        logger.debug("Intent: %s, Context: %s", intent, context)
         
         # Handle different intents
         api_result = None
@@ -259,18 +690,26 @@ Would you like to modify or cancel this booking?"""
         if intent == "check_availability":
             if context.get('date'):
                 # Call API to check availability
-                api_result = self.api_client.check_availability(
-                    date=context['date'],
-                    party_size=context.get('party_size', 2)
-                )
+                party_size = context.get('party_size', 2)
+                key = (context['date'], party_size)
+                api_result = self._cached_availability(key)
+                if api_result is None:
+                    api_result = await self._await_lookup(
+                        speculative,
+                        ('check_availability', *key),
+                        self.api_client.check_availability,
+                        date=context['date'],
+                        party_size=party_size
+                    )
+                    self._cache_availability(key, api_result)
             response = self._generate_response(intent, context, api_result)
         
-        elif intent in ["make_booking", "provide_info"]:
+        elif intent in _BOOKING_INTENTS:
             # Check if we have all required info
-            required = ['name', 'date', 'time', 'party_size']
-            if all(context.get(field) for field in required):
+            if all(context.get(field) for field in _BOOKING_FIELDS):
                 # Make the booking
-                api_result = self.api_client.create_booking(
+                api_result = await asyncio.to_thread(
+                    self.api_client.create_booking,
                     customer_name=context['name'],
                     date=context['date'],
                     time=context['time'],
@@ -280,6 +719,7 @@ Would you like to modify or cancel this booking?"""
                 
                 # Store booking reference if successful
                 if api_result.get('success'):
+                    self._availability_cache.clear()
                     booking_ref = api_result.get('data', {}).get('booking_reference')
                     if booking_ref:
                         context['last_booking_reference'] = booking_ref
@@ -293,7 +733,12 @@ Would you like to modify or cancel this booking?"""
         
         elif intent == "check_booking":
             if context.get('booking_reference'):
-                api_result = self.api_client.get_booking(context['booking_reference'])
+                api_result = await self._await_lookup(
+                    speculative,
+                    ('get_booking', context['booking_reference']),
+                    self.api_client.get_booking,
+                    context['booking_reference']
+                )
             response = self._generate_response(intent, context, api_result)
         
         elif intent == "cancel_booking":
@@ -302,7 +747,9 @@ Would you like to modify or cancel this booking?"""
                 context['booking_reference'] = context['last_booking_reference']
             
             if context.get('booking_reference'):
-                api_result = self.api_client.cancel_booking(context['booking_reference'])
+                api_result = await asyncio.to_thread(self.api_client.cancel_booking, context['booking_reference'])
+                if api_result.get('success'):
+                    self._availability_cache.clear()
             response = self._generate_response(intent, context, api_result)
         
         elif intent == "update_booking":
@@ -312,11 +759,43 @@ Would you like to modify or cancel this booking?"""
         else:
             response = self._generate_response(intent, context)
         
-        # Add response to history
+        # Discard the result of a speculative lookup the LLM didn't need;
+        # a call already running in its worker thread still completes
+        if speculative:
+            speculative[1].cancel()
+        
+        # Add response to history (the deque drops the oldest entries)
         session['history'].append({'role': 'assistant', 'content': response})
         
-        # Keep history manageable
-        if len(session['history']) > 20:
-            session['history'] = session['history'][-20:]
+        return response
+
+    def process_batch(self, messages: List[Tuple[str, str]],
+                      max_concurrency: int = 8) -> List[str]:
+        """Process (message, session_id) pairs and return the replies."""
+        return asyncio.run(self.aprocess_batch(messages, max_concurrency))
+
+    async def aprocess_batch(self, messages: List[Tuple[str, str]],
+                             max_concurrency: int = 8) -> List[str]:
+        """Process (message, session_id) pairs concurrently.
+
+        Different sessions run side by side, up to max_concurrency at a
+        time, so their LLM calls can be batched by an Ollama server started
+        with OLLAMA_NUM_PARALLEL; identical prompts share one call.
+        Messages for the same session are handled in order. Replies come
+        back in input order.
+        """
+        by_session: Dict[str, List[Tuple[int, str]]] = {}
+        for index, (message, session_id) in enumerate(messages):
+            by_session.setdefault(session_id, []).append((index, message))
+        
+        replies = [None] * len(messages)
+        limit = asyncio.Semaphore(max_concurrency)
+        
+        async def run_session(session_id: str, items: List[Tuple[int, str]]):
+            for index, message in items:
+                async with limit:
+                    replies[index] = await self.aprocess_message(message, session_id)
         
-        return response
\ No newline at end of file
+        await asyncio.gather(*(run_session(session_id, items)
+                               for session_id, items in by_session.items()))
+        return replies
@@ -1,20 +1,34 @@
 """Simple FastAPI app for the booking agent."""
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse
 from pydantic import BaseModel
 from typing import Optional
+import asyncio
 import os
 import uuid
 import logging
+import requests
 from booking_client import BookingAPIClient
-from agent import BookingAgent
+from agent import BookingAgent, close_ollama_clients
 
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Restaurant Booking Agent")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Release the booking API and Ollama connection pools on shutdown."""
+    yield
+    api_client.close()
+    await close_ollama_clients()
+
+
+# orjson encodes responses faster than the stdlib json encoder
+app = FastAPI(title="Restaurant Booking Agent", default_response_class=ORJSONResponse,
+              lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -35,8 +49,12 @@ api_client = BookingAPIClient(
 agent = BookingAgent(
     api_client=api_client,
     model=os.getenv("OLLAMA_MODEL", "llama3.2:3b"),  # Changed to llama3.2:3b
-    temperature=0.1,  # Keep low for consistency
-    base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+    temperature=float(os.getenv("OLLAMA_TEMPERATURE", "0")),  # Greedy decoding for stable extraction
+    base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
+    force_llm=os.getenv("FORCE_LLM", "false").lower() == "true",
+    session_ttl=int(os.getenv("SESSION_TIMEOUT_MINUTES", "60")) * 60,
+    keep_alive=os.getenv("OLLAMA_KEEP_ALIVE", "30m"),
+    llm_timeout=float(os.getenv("LLM_TIMEOUT_SECONDS", "8"))
 )
 
 
@@ -56,10 +74,10 @@ async def chat(msg: ChatMessage) -> ChatResponse:
     session_id = msg.session_id or str(uuid.uuid4())
     
     try:
-        response = agent.process_message(msg.message, session_id)
+        response = await agent.aprocess_message(msg.message, session_id)
         return ChatResponse(response=response, session_id=session_id)
     except Exception as e:
-        logger.error(f"Error processing message: {e}")
+        logger.error("Error processing message: %s", e)
         # Provide a more helpful error message
         if "ollama" in str(e).lower():
             error_msg = "Cannot connect to Ollama. Please ensure:\n1. Ollama is installed\n2. Ollama server is running (ollama serve)\n3. Model is pulled (ollama pull llama3.2:3b)"
@@ -84,33 +102,39 @@ async def root():
     return {"message": "Chat API running on http://localhost:8000", "docs": "http://localhost:8000/docs"}
 
 
+def _ollama_status() -> str:
+    """Probe the Ollama server."""
+    try:
+        resp = requests.get("http://localhost:11434/api/tags", timeout=2)
+        if resp.status_code == 200:
+            models = resp.json().get("models", [])
+            return f"running ({len(models)} models)"
+        return "not responding"
+    except:
+        return "not running"
+
+
+def _booking_api_status() -> str:
+    """Probe the booking API."""
+    try:
+        resp = requests.get("http://localhost:8547/docs", timeout=2)
+        if resp.status_code == 200:
+            return "running"
+        return "not responding"
+    except:
+        return "not running"
+
+
 @app.get("/health")
 async def health():
     """Health check with service status."""
     try:
-        # Check if we can reach Ollama
-        import requests
-        ollama_status = "unknown"
-        try:
-            resp = requests.get("http://localhost:11434/api/tags", timeout=2)
-            if resp.status_code == 200:
-                models = resp.json().get("models", [])
-                ollama_status = f"running ({len(models)} models)"
-            else:
-                ollama_status = "not responding"
-        except:
-            ollama_status = "not running"
-        
-        # Check if we can reach the booking API
-        booking_api_status = "unknown"
-        try:
-            resp = requests.get("http://localhost:8547/docs", timeout=2)
-            if resp.status_code == 200:
-                booking_api_status = "running"
-            else:
-                booking_api_status = "not responding"
-        except:
-            booking_api_status = "not running"
+        # Probe both services at once, off the event loop, so a slow
+        # service doesn't stall chat requests
+        ollama_status, booking_api_status = await asyncio.gather(
+            asyncio.to_thread(_ollama_status),
+            asyncio.to_thread(_booking_api_status)
+        )
         
         return {
             "status": "healthy",
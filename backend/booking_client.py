@@ -1,6 +1,8 @@
 """API client for the restaurant booking server."""
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Dict, List, Optional, Any
 from datetime import datetime, date
 import logging
@@ -12,7 +14,8 @@ logger = logging.getLogger(__name__)
 class BookingAPIClient:
     """Client for interacting with the restaurant booking API."""
     
-    def __init__(self, base_url: str, bearer_token: str, restaurant_name: str = "TheHungryUnicorn"):
+    def __init__(self, base_url: str, bearer_token: str, restaurant_name: str = "TheHungryUnicorn",
+                 pool_size: int = 32):
         self.base_url = base_url.rstrip('/')
         self.bearer_token = bearer_token
         self.restaurant_name = restaurant_name
@@ -20,6 +23,17 @@ class BookingAPIClient:
             'Authorization': f'Bearer {bearer_token}',
             'Content-Type': 'application/x-www-form-urlencoded'
         }
+        # Reuse connections across calls instead of reconnecting each time.
+        # The agent calls from worker threads, so keep as many connections
+        # as asyncio.to_thread's default pool can use (requests keeps 10)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+    
+    def close(self):
+        """Close the pooled connections."""
+        self.session.close()
     
     def check_availability(self, date: str, time: Optional[str] = None, party_size: Optional[int] = None) -> Dict[str, Any]:
         """
@@ -41,15 +55,15 @@ class BookingAPIClient:
                 'ChannelCode': 'ONLINE'
             }
             
-            response = requests.post(
+            response = self.session.post(
                 endpoint,
                 data=urlencode(data),
                 headers=self.headers
             )
             response.raise_for_status()
-            return {'success': True, 'data': response.json()}
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error checking availability: {e}")
+            return {'success': True, 'data': orjson.loads(response.content)}
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+            logger.error("Error checking availability: %s", e)
             return {'success': False, 'error': str(e)}
     
     def create_booking(self, customer_name: str, date: str, time: str, party_size: int, 
@@ -91,15 +105,15 @@ class BookingAPIClient:
             if special_requests:
                 data['SpecialRequests'] = special_requests
             
-            response = requests.post(
+            response = self.session.post(
                 endpoint,
                 data=urlencode(data),
                 headers=self.headers
             )
             response.raise_for_status()
-            return {'success': True, 'data': response.json()}
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error creating booking: {e}")
+            return {'success': True, 'data': orjson.loads(response.content)}
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+            logger.error("Error creating booking: %s", e)
             return {'success': False, 'error': str(e)}
     
     def get_booking(self, booking_id: str) -> Dict[str, Any]:
@@ -113,14 +127,14 @@ class BookingAPIClient:
             # Correct endpoint path
             endpoint = f"{self.base_url}/api/ConsumerApi/v1/Restaurant/{self.restaurant_name}/Booking/{booking_id}"
             
-            response = requests.get(
+            response = self.session.get(
                 endpoint,
                 headers={'Authorization': f'Bearer {self.bearer_token}'}
             )
             response.raise_for_status()
-            return {'success': True, 'data': response.json()}
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error retrieving booking: {e}")
+            return {'success': True, 'data': orjson.loads(response.content)}
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+            logger.error("Error retrieving booking: %s", e)
             return {'success': False, 'error': str(e)}
     
     def update_booking(self, booking_id: str, **kwargs) -> Dict[str, Any]:
@@ -147,15 +161,15 @@ class BookingAPIClient:
             if 'special_requests' in kwargs:
                 data['SpecialRequests'] = kwargs['special_requests']
             
-            response = requests.patch(
+            response = self.session.patch(
                 endpoint,
                 data=urlencode(data),
                 headers=self.headers
             )
             response.raise_for_status()
-            return {'success': True, 'data': response.json()}
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error updating booking: {e}")
+            return {'success': True, 'data': orjson.loads(response.content)}
+        except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+            logger.error("Error updating booking: %s", e)
             return {'success': False, 'error': str(e)}
     
     def cancel_booking(self, booking_id: str) -> Dict[str, Any]:
@@ -174,7 +188,7 @@ class BookingAPIClient:
                 'cancellationReasonId': '1'  
             }
             
-            response = requests.post(
+            response = self.session.post(
                 endpoint,
                 data=urlencode(data),
                 headers=self.headers
@@ -182,5 +196,5 @@ class BookingAPIClient:
             response.raise_for_status()
             return {'success': True, 'message': 'Booking cancelled successfully'}
         except requests.exceptions.RequestException as e:
-            logger.error(f"Error cancelling booking: {e}")
+            logger.error("Error cancelling booking: %s", e)
             return {'success': False, 'error': str(e)}
\ No newline at end of file
@@ -0,0 +1,206 @@
+"""Regression tests for the booking agent."""
+
+import asyncio
+from datetime import date, timedelta
+
+import orjson
+
+import agent as agent_module
+from agent import BookingAgent, _fallback_intent, _format_time, _is_plausible_name, _keyword_intent
+from tools import DateTimeParser
+
+
+class FakeAPI:
+    """Booking API stand-in that records the calls made to it."""
+
+    def __init__(self):
+        self.bookings = []
+        self.availability_checks = []
+        self.cancelled = []
+
+    def create_booking(self, **kwargs):
+        self.bookings.append(kwargs)
+        return {'success': True, 'data': {'booking_reference': 'ABC1234'}}
+
+    def check_availability(self, date, party_size):
+        self.availability_checks.append((date, party_size))
+        return {'success': True, 'data': {'available_slots': [{'time': '19:00:00'}]}}
+
+    def cancel_booking(self, booking_reference):
+        self.cancelled.append(booking_reference)
+        return {'success': True}
+
+
+class FakeOllama:
+    """Ollama client stand-in that returns a fixed extraction."""
+
+    def __init__(self, reply, delay=0):
+        self.reply = reply
+        self.delay = delay
+        self.calls = 0
+
+    async def chat(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        # Ollama drops the "}" stop sequence from the reply
+        content = orjson.dumps(self.reply).decode()
+        return {'message': {'content': content[:-1]}}
+
+
+def test_bare_number_with_known_party_size_goes_to_llm(monkeypatch):
+    api = FakeAPI()
+    agent = BookingAgent(api)
+    ollama = FakeOllama({"intent": "provide_info", "time": "7"})
+    monkeypatch.setattr(agent_module, '_ollama_client', lambda host: ollama)
+    session = agent._get_session('s')
+    session['context'].update(name='Jo Bloggs', date='2026-10-17', party_size=4)
+
+    assert agent._fast_understand("7", session['context']) is None
+
+    agent.process_message("7", 's')
+
+    assert ollama.calls == 1
+    assert api.bookings == [{
+        'customer_name': 'Jo Bloggs',
+        'date': '2026-10-17',
+        'time': '19:00',
+        'party_size': 4,
+        'special_requests': None
+    }]
+
+
+def test_fast_path_greetings_and_closings():
+    agent = BookingAgent(FakeAPI())
+
+    assert agent._fast_understand("Hello there!", {}) == {"intent": "greeting"}
+    assert agent._fast_understand("thanks so much", {}) == {"intent": "thanks"}
+    assert agent._fast_understand("bye!", {}) == {"intent": "goodbye"}
+    assert agent._fast_understand("hi, can I book for friday?", {}) is None
+
+
+def test_fast_path_cancel_and_references():
+    agent = BookingAgent(FakeAPI())
+
+    assert agent._fast_understand("cancel abc1234", {}) == {
+        "intent": "cancel_booking", "booking_reference": "ABC1234"}
+    assert agent._fast_understand("cancel my booking", {}) == {"intent": "cancel_booking"}
+    # The reference has to be a separate word
+    assert agent._fast_understand("cancelabc1234", {}) is None
+    assert agent._fast_understand("ABC1234", {}) == {
+        "intent": "check_booking", "booking_reference": "ABC1234"}
+    assert agent._fast_understand("can you check my booking ABC1234", {}) == {
+        "intent": "check_booking", "booking_reference": "ABC1234"}
+
+
+def test_fast_path_bare_number_is_party_size_mid_booking():
+    agent = BookingAgent(FakeAPI())
+
+    assert agent._fast_understand("4", {'name': 'Jo Bloggs'}) == {
+        "intent": "provide_info", "party_size": 4}
+    assert agent._fast_understand("4", {}) is None
+    assert agent._fast_understand("40", {'name': 'Jo Bloggs'}) is None
+
+
+def test_keyword_intent():
+    assert _keyword_intent("cancel my booking") == "cancel_booking"
+    assert _keyword_intent("is friday available?") == "check_availability"
+    assert _keyword_intent("What's your cancellation policy?") == "unclear"
+    # A keyword alone never books, changes or cancels
+    assert _fallback_intent("cancel my booking") == "unclear"
+    assert _fallback_intent("I'd like to book a table") == "unclear"
+    assert _fallback_intent("is friday available?") == "check_availability"
+
+
+def test_parse_date():
+    today = date.today()
+
+    assert DateTimeParser.parse_date("tonight") == today.isoformat()
+    assert DateTimeParser.parse_date("tomorrow") == (today + timedelta(days=1)).isoformat()
+    assert DateTimeParser.parse_date("2026-10-20") == "2026-10-20"
+    friday = date.fromisoformat(DateTimeParser.parse_date("friday"))
+    assert friday.weekday() == 4 and 0 < (friday - today).days <= 7
+
+
+def test_parse_time():
+    assert DateTimeParser.parse_time("7") == "19:00"
+    assert DateTimeParser.parse_time("7:30") == "19:30"
+    assert DateTimeParser.parse_time("7:30 p.m.") == "19:30"
+    assert DateTimeParser.parse_time("12am") == "00:00"
+    # Explicit 24-hour times are kept as written
+    assert DateTimeParser.parse_time("09:00") == "09:00"
+    assert DateTimeParser.parse_time("11:30") == "11:30"
+
+
+def test_format_time():
+    assert _format_time("19:30:00") == "7:30 pm"
+    assert _format_time("7:30") == "7:30 am"
+    assert _format_time("00:15") == "12:15 am"
+    assert _format_time("soon") == "soon"
+
+
+def test_name_blocklist():
+    assert _is_plausible_name("Jo Bloggs")
+    assert _is_plausible_name("Dr. O'Brien-Smith")
+    assert not _is_plausible_name("tomorrow")
+    assert not _is_plausible_name("cancel booking")
+    assert not _is_plausible_name("Table 4")
+
+
+def test_sessions_expire_and_least_recently_used_are_evicted():
+    agent = BookingAgent(FakeAPI(), max_sessions=2, session_ttl=60)
+    agent._get_session('a')['last_seen'] -= 120
+    agent._get_session('b')
+
+    assert list(agent.sessions) == ['b']
+
+    agent._get_session('c')
+    agent._get_session('b')
+    agent._get_session('d')
+
+    assert list(agent.sessions) == ['b', 'd']
+
+
+def test_extractions_and_availability_are_reused(monkeypatch):
+    api = FakeAPI()
+    agent = BookingAgent(api)
+    ollama = FakeOllama({"intent": "check_availability", "date": "2026-10-17"})
+    monkeypatch.setattr(agent_module, '_ollama_client', lambda host: ollama)
+
+    agent.process_message("any tables free that day?", 'a')
+    agent.process_message("any tables free that day?", 'b')
+
+    assert ollama.calls == 1
+    assert api.availability_checks == [('2026-10-17', 2)]
+
+
+def test_identical_extractions_in_flight_share_one_call(monkeypatch):
+    agent = BookingAgent(FakeAPI())
+    ollama = FakeOllama({"intent": "greeting"}, delay=0.05)
+    monkeypatch.setattr(agent_module, '_ollama_client', lambda host: ollama)
+
+    async def both():
+        return await asyncio.gather(agent.aprocess_message("howdy", 'a'),
+                                    agent.aprocess_message("howdy", 'b'))
+
+    replies = asyncio.run(both())
+
+    assert ollama.calls == 1
+    assert replies[0] == replies[1]
+
+
+def test_timeout_keeps_details_and_never_acts(monkeypatch):
+    api = FakeAPI()
+    agent = BookingAgent(api, llm_timeout=0.01)
+    ollama = FakeOllama({"intent": "cancel_booking"}, delay=1)
+    monkeypatch.setattr(agent_module, '_ollama_client', lambda host: ollama)
+    session = agent._get_session('s')
+    session['context'].update(name='Jo Bloggs', last_booking_reference='ABC1234')
+
+    agent.process_message("What's your cancellation policy?", 's')
+    agent.process_message("book a table for 4 tomorrow at 7", 's')
+
+    assert api.cancelled == []
+    assert api.bookings == []
+    assert session['context']['party_size'] == 4
+    assert session['context']['time'] == '19:00'
+    assert session['context']['date'] == (date.today() + timedelta(days=1)).isoformat()
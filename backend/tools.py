@@ -1,9 +1,22 @@
 """Simple date and time parsing utilities."""
 
-from datetime import datetime, timedelta
+from datetime import date, timedelta
 import re
 
 
+_TIME_STRIP = str.maketrans('', '', '. ')
+_TIME_RE = re.compile(r'(\d{1,2})(?::(\d{2}))?\s*([ap]m)?')
+_DATE_WORD_RE = re.compile(
+    r'today|tonight|tomorrow|weekend|monday|tuesday|wednesday|thursday|friday|saturday|sunday'
+)
+# "weekend" means the coming Saturday
+_WEEKDAY_IDX = {
+    'monday': 0, 'tuesday': 1, 'wednesday': 2,
+    'thursday': 3, 'friday': 4, 'saturday': 5, 'sunday': 6,
+    'weekend': 5
+}
+
+
 class DateTimeParser:
     """Utility class for parsing natural language dates and times."""
     
@@ -11,43 +24,29 @@ class DateTimeParser:
     def parse_date(date_str: str) -> str:
         """Convert natural language date to YYYY-MM-DD format."""
         if not date_str:
-            return datetime.now().strftime('%Y-%m-%d')
+            return date.today().isoformat()
             
         date_str = date_str.lower().strip()
-        today = datetime.now()
         
-        # Handle relative dates
-        if 'today' in date_str:
-            return today.strftime('%Y-%m-%d')
-        elif 'tomorrow' in date_str:
-            return (today + timedelta(days=1)).strftime('%Y-%m-%d')
-        elif 'weekend' in date_str or 'saturday' in date_str:
-            days_ahead = 5 - today.weekday()
-            if days_ahead <= 0:
-                days_ahead += 7
-            return (today + timedelta(days=days_ahead)).strftime('%Y-%m-%d')
-        elif 'sunday' in date_str:
-            days_ahead = 6 - today.weekday()
-            if days_ahead <= 0:
-                days_ahead += 7
-            return (today + timedelta(days=days_ahead)).strftime('%Y-%m-%d')
+        # One scan finds the date word; only then read the clock
+        match = _DATE_WORD_RE.search(date_str)
+        if not match:
+            return date_str
         
-        # Handle weekdays
-        weekdays = {
-            'monday': 0, 'tuesday': 1, 'wednesday': 2, 
-            'thursday': 3, 'friday': 4, 'saturday': 5, 'sunday': 6
-        }
+        word = match.group(0)
+        today = date.today()
         
-        for day_name, day_num in weekdays.items():
-            if day_name in date_str:
-                days_ahead = day_num - today.weekday()
-                if days_ahead <= 0:
-                    days_ahead += 7
-                if 'next' in date_str:
-                    days_ahead += 7
-                return (today + timedelta(days=days_ahead)).strftime('%Y-%m-%d')
+        # Handle relative dates
+        if word in ('today', 'tonight'):
+            return today.isoformat()
+        elif word == 'tomorrow':
+            return (today + timedelta(days=1)).isoformat()
         
-        return date_str
+        # Handle weekdays, one to seven days ahead
+        days_ahead = (_WEEKDAY_IDX[word] - today.weekday() - 1) % 7 + 1
+        if 'next' in date_str:
+            days_ahead += 7
+        return (today + timedelta(days=days_ahead)).isoformat()
     
     @staticmethod
     def parse_time(time_str: str) -> str:
@@ -55,22 +54,25 @@ class DateTimeParser:
         if not time_str:
             return '19:00'
             
-        time_str = time_str.lower().strip().replace('.', '').replace(' ', '')
+        time_str = time_str.strip().lower().translate(_TIME_STRIP)
         
         # Handle am/pm format
-        time_match = re.search(r'(\d{1,2})(?::(\d{2}))?\s*([ap]m)?', time_str)
+        time_match = _TIME_RE.search(time_str)
         if time_match:
-            hour = int(time_match.group(1))
-            minute = int(time_match.group(2) or 0)
-            meridiem = time_match.group(3)
+            hour_str, minute_str, meridiem = time_match.groups()
+            hour = int(hour_str)
+            minute = int(minute_str or 0)
+            # "09:00" or "11:30" is an explicit 24-hour time
+            explicit = hour_str.startswith('0') or (len(hour_str) == 2 and minute_str)
             
             if meridiem == 'pm' and hour < 12:
                 hour += 12
             elif meridiem == 'am' and hour == 12:
                 hour = 0
-            elif not meridiem and 1 <= hour <= 11:
-                if hour <= 5:
-                    hour += 12
+            elif not meridiem and not explicit and 1 <= hour <= 11:
+                # Otherwise an hour without am/pm is an afternoon or dinner
+                # time: "7" or "7:30" means pm
+                hour += 12
             
             return f"{hour:02d}:{minute:02d}"
         